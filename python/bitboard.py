@@ -9,9 +9,9 @@ Lowlevel bitboard operations. Use with care as no boundary nor type checks are
 performed for performance reasons.
 """
 
-from random import randint, getrandbits
+from random import randint, choice
+from functools import lru_cache
 from enum import IntEnum
-import re
 
 class Players(IntEnum):
     """Index of start of bitboards"""
@@ -30,11 +30,22 @@ class Eval(IntEnum):
     WON  = 1
     DRAW = 0
 
+# Plain int copies of the constants above. Enum members are slower in
+# arithmetic, so these are used internally.
+PLAYER1 = Players.ONE.value
+PLAYER2 = Players.TWO.value
+BOTH    = Players.BOTH.value
+EMPTY   = BBoard.EMPTY.value
+FULL    = BBoard.FULL.value
+LENGTH  = BBoard.LENGTH.value
+WON     = Eval.WON.value
+DRAW    = Eval.DRAW.value
+
 def other(player):
     """Return other player"""
 #0^9 -> 9
     #9^9 -> 0
-    return player^Players.TWO
+    return player^PLAYER2
 
 def bboard(board, index):
     """
@@ -44,80 +55,169 @@ def bboard(board, index):
     index = 2 -> total board
     No boundary nor type check for performance reason!
     """
-    return (board >> index) & BBoard.FULL
+    return (board >> index) & FULL
 
 def play(board, player, move):
     """
     play move for player and return new board
     No boundary nor type check for performance reason!
     """
-    return board | (1 << (move + player)) | (1 << (move + Players.BOTH))
+    return board | (1 << (move + player)) | (1 << (move + BOTH))
+
+# Bits set by a stone of each player on each square
+X_BITS = tuple(play(EMPTY, PLAYER1, i) for i in range(LENGTH))
+O_BITS = tuple(play(EMPTY, PLAYER2, i) for i in range(LENGTH))
 
 def is_legal(board):
     """Is board legal?"""
-    bb0 = bboard(board, Players.ONE)
-    bb1 = bboard(board, Players.TWO)
-    bb2 = bboard(board, Players.BOTH)
+    bb0 = bboard(board, PLAYER1)
+    bb1 = bboard(board, PLAYER2)
+    bb2 = bboard(board, BOTH)
     return (not bb0 & bb1) and ((bb0 | bb1) == bb2)
 
 def is_full(board):
     """Is board full?"""
-    return (bboard(board, Players.BOTH)) == BBoard.FULL
+    return (bboard(board, BOTH)) == FULL
 
-WINS = [0b000000111, 0b000111000, 0b111000000,
-                   0b100100100, 0b010010010, 0b001001001,
-                   0b100010001, 0b001010100]
+WINS = (0b000000111, 0b000111000, 0b111000000,
+        0b100100100, 0b010010010, 0b001001001,
+        0b100010001, 0b001010100)
+IS_WON = bytes(any(bb & bw == bw for bw in WINS)
+               for bb in range(FULL + 1))
 def is_won(board, player):
-    """Is position won?"""
-    bb = bboard(board, player)
-    return any([bb & bw == bw for bw in WINS])
+    """Is position won? Returns 1 or 0"""
+    return IS_WON[bboard(board, player)]
 
+# Center first, then corners and edges, for earlier alpha beta cutoffs
+ORDER = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+MOVES = tuple(tuple(i for i in ORDER if not (bb >> i) & 1)
+              for bb in range(FULL + 1))
 def moves(board):
-    """Return all possible moves"""
-    bb = bboard(board, Players.BOTH)
-    for i in range(BBoard.LENGTH):
-        if not (bb >> i) & 1:
-            yield i
-
+    """Return all possible moves, strongest first"""
+    return MOVES[bboard(board, BOTH)]
+
+# Rotations and reflections of the board, as new (row, column) of square
+# (r, c). Row 0 is 1, column 0 is a.
+SQUARE_SYMMETRIES = (lambda r, c: (r, c),
+                     lambda r, c: (c, 2 - r),
+                     lambda r, c: (2 - r, 2 - c),
+                     lambda r, c: (2 - c, r),
+                     lambda r, c: (r, 2 - c),
+                     lambda r, c: (2 - r, c),
+                     lambda r, c: (c, r),
+                     lambda r, c: (2 - c, 2 - r))
+def _permutations(symmetry):
+    """Return every bitboard with its squares moved by symmetry"""
+    table = [0]
+    for i in range(LENGTH):
+        r, c   = symmetry(*divmod(i, 3))
+        bit    = 1 << (3*r + c)
+        table += [bb | bit for bb in table]
+    return tuple(table)
+SYMMETRIES = tuple(_permutations(sym) for sym in SQUARE_SYMMETRIES)
+
+def canonical(board):
+    """
+    Return canonical board, the smallest of the 8 equivalent boards under
+    rotation and reflection. Equivalent boards have the same score.
+    """
+    white    = board & FULL
+    black    = (board >> PLAYER2) & FULL
+    occupied = (board >> BOTH) & FULL
+    return min(s[white] | (s[black] << PLAYER2) | (s[occupied] << BOTH)
+               for s in SYMMETRIES)
+
+# Symmetric transpositions pay off only in the opening. Children are
+# canonicalized while the parent has fewer than SHALLOW stones, deeper
+# canonical() costs more than it saves.
+SHALLOW    = 3
+IS_SHALLOW = bytes(bin(bb).count("1") < SHALLOW for bb in range(FULL + 1))
+
+# The searches below inline bboard, is_won, is_full, moves, other and play,
+# as function calls dominate their run time.
+
+@lru_cache(maxsize=None)
 def minimax(board, player):
     """
     Return score of move.
     Uses minimax (negamax) algorithm.
+    Memoized on canonical boards in the opening, every position is only
+    evaluated once.
     """
-    if is_won(board, player):
-        return Eval.WON
-    if is_full(board):
-        return Eval.DRAW
-
-    sc = Eval.WON
-    o  = other(player)
-    for m in moves(board):
-        sc = min(sc, -minimax(play(board, o, m), o))
-        if sc == -Eval.WON:
-            break
+    if IS_WON[(board >> player) & FULL]:
+        return WON
+    occupied = (board >> BOTH) & FULL
+    if occupied == FULL:
+        return DRAW
+
+    sc = WON
+    o  = player^PLAYER2
+    for m in MOVES[occupied]:
+        child = board | (1 << (m + o)) | (1 << (m + BOTH))
+        if IS_SHALLOW[occupied]:
+            child = canonical(child)
+        sci = -minimax(child, o)
+        if sci < sc:
+            sc = sci
+            if sc == -WON:
+                break
     return sc
 
-def alphabeta(board, player, alpha = -Eval.WON):
+@lru_cache(maxsize=None)
+def alphabeta(board, player, alpha = -WON):
     """
     Return score of move.
     Uses alpha beta pruning algorithm.
+    Memoized on canonical boards in the opening, alpha is part of the key
+    as the result is only a bound.
     """
-    if is_won(board, player):
-        return Eval.WON
-    if is_full(board):
-        return Eval.DRAW
-
-    beta = Eval.WON
-    o  = other(player)
-    for m in moves(board):
-        beta = min(beta, -alphabeta(play(board, o, m), o, -beta))
+    if IS_WON[(board >> player) & FULL]:
+        return WON
+    occupied = (board >> BOTH) & FULL
+    if occupied == FULL:
+        return DRAW
+
+    beta = WON
+    o    = player^PLAYER2
+    for m in MOVES[occupied]:
+        child = board | (1 << (m + o)) | (1 << (m + BOTH))
+        if IS_SHALLOW[occupied]:
+            child = canonical(child)
+        sc = -alphabeta(child, o, -beta)
+        if sc < beta:
+            beta = sc
         if beta <= alpha:
             break
     return beta
 
-score = minimax
 score = alphabeta
 
+def search_best_moves(board, player):
+    """
+    Return all best moves and their score by searching the game tree.
+    If board is already won, this leads to strange behaviour.
+    If board is full, return is ((), -2)
+    """
+    sc       = 2*-WON
+    ms       = []
+    bb       = (board >> player) & FULL
+    occupied = (board >> BOTH) & FULL
+    for mi in MOVES[occupied]:
+        # Children that are won or full are scored without searching
+        bit = 1 << mi
+        if IS_WON[bb | bit]:
+            sci = WON
+        elif occupied | bit == FULL:
+            sci = DRAW
+        else:
+            sci = score(board | (bit << player) | (bit << BOTH), player)
+        if sci > sc:
+            sc = sci
+            ms = [mi]
+        elif sci == sc:
+            ms.append(mi)
+    return tuple(ms), sc
+
 def best_move(board, player, randomize=True):
     """
     Return best move and score.
@@ -125,27 +225,19 @@ def best_move(board, player, randomize=True):
     If board is already won, this leads to strange behaviour.
     If board is full, return is (-1, -2)
     """
-    sc = 2*-Eval.WON
-    m  = -1
-    for mi in moves(board):
-        sci = score(play(board, player, mi), player)
-        if sci > sc:
-            sc = sci
-            m  = mi
-        elif randomize and sci == sc and getrandbits(1):
-            sc = sci
-            m  = mi
-    return m, sc
-
+    ms, sc = search_best_moves(board, player)
+    if not ms:
+        return -1, sc
+    if randomize:
+        return choice(ms), sc
+    return ms[0], sc
 
 def str2move(smove):
     """
     Parse coordinates to move (0-8).
     Return -1 if illegal move.
     """
-
-    r = re.compile(r"^[a-cA-C][1-3]$")
-    if not r.match(smove):
+    if len(smove) != 2 or smove[0] not in "abcABC" or smove[1] not in "123":
         return -1
 
     return (int(smove[1]) - 1)*3 + ord(smove[0].lower()) - ord('a')
@@ -158,10 +250,12 @@ def move2str(move):
     if not 0 <= move <= 8:
         return ""
 
-    i = move%3
-    j = move//3
-    return "".join(["abc"[i], "123"[j]])
+    j, i = divmod(move, 3)
+    return "abc"[i] + "123"[j]
 
+CHAR_BITS = {".": (EMPTY,)*LENGTH,
+             "x": X_BITS, "X": X_BITS,
+             "o": O_BITS, "O": O_BITS}
 def str2board(sboard):
     """
     Parse string to move. Return -1 if illegal board
@@ -169,21 +263,13 @@ def str2board(sboard):
     'x' -> player 1
     'o' -> player 2
     """
-
-    r      = re.compile("^[.xoXO]{9}$")
-    if not r.match(sboard):
+    if len(sboard) != LENGTH or sboard.strip(".xoXO"):
         return -1
 
-    sboard = sboard.lower()
-    board = 0
-    for i, s in enumerate(sboard):
-        if s == "x":
-            board = play(board, Players.ONE, i)
-        elif s == "o":
-            board = play(board, Players.TWO, i)
-
-    return board
+    return sum(CHAR_BITS[s][i] for i, s in enumerate(sboard))
 
+X_CHAR = ord("x")
+O_CHAR = ord("o")
 def board2str(board):
     """
     Parse board to string. Return "" if illegal board
@@ -194,31 +280,23 @@ def board2str(board):
     if not is_legal(board):
         return ""
 
-    s = ["."]*9
-    white = bboard(board, Players.ONE)
-    black = bboard(board, Players.TWO)
+    s        = bytearray(b"."*LENGTH)
+    white    = bboard(board, PLAYER1)
+    occupied = bboard(board, BOTH)
 
-    for i in range(BBoard.LENGTH):
-        bi = 1 << i
-        if white & bi:
-            s[i] = "x"
-        elif black & bi:
-            s[i] = "o"
+    # Only visit occupied squares, lowest set bit first
+    while occupied:
+        lsb       = occupied & -occupied
+        s[lsb.bit_length() - 1] = X_CHAR if white & lsb else O_CHAR
+        occupied ^= lsb
 
-    return "".join(s)
+    return s.decode()
 
 def str2player(splayer):
     """Parse string to player"""
-
-    r = re.compile("^[xoXO12]$")
-
-    if not r.match(splayer):
-        return -1
-
-    splayer = splayer.lower()
-    if splayer in ["1", "x"]:
+    if splayer in ("1", "x", "X"):
         return Players.ONE
-    if splayer in ["2", "o"]:
+    if splayer in ("2", "o", "O"):
         return Players.TWO
 
     return -1
@@ -284,11 +362,25 @@ def test():
     assert is_won(0b111000000, Players.ONE)
     assert not is_won(0b111000000, Players.TWO)
     assert is_won(0b111000000 << 9, Players.TWO)
+    for bb in range(BBoard.FULL + 1):
+        assert is_won(bb, Players.ONE) == any(bb & bw == bw for bw in WINS)
+
+    # canonical
+    corners = [play(BBoard.EMPTY, Players.ONE, i) for i in (0, 2, 6, 8)]
+    assert len(set(canonical(b) for b in corners)) == 1
+    edges = [play(BBoard.EMPTY, Players.TWO, i) for i in (1, 3, 5, 7)]
+    assert len(set(canonical(b) for b in edges)) == 1
+    for b in corners + edges:
+        assert canonical(canonical(b)) == canonical(b) <= b
+    b = str2board("xo.......")
+    assert canonical(b) == canonical(str2board("x..o....."))
+    assert canonical(b) != canonical(str2board("x...o...."))
 
     # moves
-    assert list(moves(0)) == list(range(9))
+    assert moves(0) == ORDER
     assert not list(moves(0b111111111000000000111111111))
     assert not list(moves(0b111111111111111111000000000))
+    assert moves(play(BBoard.EMPTY, Players.ONE, 4)) == (0, 2, 6, 8, 1, 3, 5, 7)
 
     # score
     b = play(BBoard.EMPTY, Players.ONE, 0)
@@ -297,8 +389,16 @@ def test():
     assert score(b, Players.ONE)  == 1
     assert score(b, Players.TWO)  == -1
 
+    # search_best_moves
+    assert search_best_moves(BBoard.EMPTY, Players.ONE) == (ORDER, 0)
+    assert search_best_moves(0b111111111000000000111111111,
+                             Players.TWO) == ((), -2)
+    assert search_best_moves(str2board("xx.oo...."), Players.ONE) == ((2,), 1)
+    assert search_best_moves(str2board("xoxxoo.xo"), Players.ONE) == ((6,), 1)
+    assert search_best_moves(str2board("xoxoxo.xo"), Players.TWO) == ((6,), 0)
+
     # best_move
-    assert best_move(BBoard.EMPTY, Players.ONE, False) == (0, 0)
+    assert best_move(BBoard.EMPTY, Players.ONE, False) == (4, 0)
     assert best_move(BBoard.EMPTY, Players.ONE)[1]     == 0
 
     assert best_move(0b11, Players.ONE)[1] == 1
@@ -313,6 +413,8 @@ def test():
     assert str2move("ab")  == -1
     assert str2move("1a")  == -1
     assert str2move("a1 ") == -1
+    assert str2move("d1")  == -1
+    assert str2move("a4")  == -1
 
     assert str2move("a1") == 0
     assert str2move("A1") == 0
@@ -337,8 +439,11 @@ def test():
     assert str2board(9*"o") == 0b111111111111111111000000000
     assert str2board(9*"x") == 0b111111111000000000111111111
     assert str2board(9*"a") == -1
+    assert str2board(9*" ") == -1
+    assert str2board(10*".") == -1
 
     assert str2board(".oxo.xx..") == 0b1101110000001010001100100
+    assert str2board(".OXo.Xx..") == 0b1101110000001010001100100
 
     #Board2str
     assert board2str(BBoard.EMPTY) == 9*"."
@@ -356,13 +461,16 @@ def test():
     assert str2player("")   == -1
     assert str2player(" ")  == -1
     assert str2player("xx") == -1
+    assert str2player("3")  == -1
     for p1 in ["1", "x", "X"]:
         assert str2player(p1) == Players.ONE
     for p2 in ["2", "o", "O"]:
         assert str2player(p2) == Players.TWO
 
 def test_minimax_perf():
+    minimax.cache_clear()
     minimax(BBoard.EMPTY, Players.ONE)
 
 def test_alphabeta_perf():
+    alphabeta.cache_clear()
     alphabeta(BBoard.EMPTY, Players.ONE)
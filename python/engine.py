@@ -19,7 +19,14 @@ class Engine:
 
     def __init__(self):
         """Create engine with initially empty board"""
-        self._board = 0
+        self._update(0)
+
+    def _update(self, board):
+        """Set board and cache whether it is full or won by either player"""
+        self._board  = board
+        self._status = (bb.is_full(board),
+                        bool(bb.is_won(board, bb.Players.ONE)),
+                        bool(bb.is_won(board, bb.Players.TWO)))
 
     def __str__(self):
         """Return string representation of board"""
@@ -40,18 +47,18 @@ class Engine:
             return False
 
         if self._board != b:
-            self._board = b
+            self._update(b)
             return True
 
         return False
 
     def reset(self):
         """Set Board to initial empty state."""
-        self._board = 0
+        self._update(0)
 
     def is_full(self):
         """Is board full?"""
-        return bb.is_full(self._board)
+        return self._status[0]
 
     def is_won(self, player):
         """Is the position won? If player is not legal, return false"""
@@ -59,13 +66,11 @@ class Engine:
         if p < 0:
             return False
 
-        return bb.is_won(self._board, p)
+        return self._status[1] if p == bb.Players.ONE else self._status[2]
 
     def is_finished(self):
         """Is game over?"""
-        return (bb.is_full(self._board)
-                or bb.is_won(self._board, bb.Players.ONE)
-                or bb.is_won(self._board, bb.Players.TWO))
+        return any(self._status)
 
     def play(self, player, move):
         """
@@ -77,15 +82,15 @@ class Engine:
             return False
 
         m = bb.str2move(move)
-        if m not in bb.moves(self._board):
+        if m < 0 or (self._board >> (m + bb.BOTH)) & 1: # illegal or occupied
             return False
 
         p = bb.str2player(player)
         if p < 0:
             return False
 
-        b_old       = self._board
-        self._board = bb.play(self._board, p, m)
+        b_old = self._board
+        self._update(bb.play(self._board, p, m))
 
         return b_old != self._board # impossible move
 
@@ -106,7 +111,7 @@ class Engine:
             return False
 
         b_old = self._board
-        self._board = bb.play(self._board, p, m)
+        self._update(bb.play(self._board, p, m))
         return b_old != self._board # Should not happen
 
 def test():
@@ -130,7 +135,7 @@ def test():
 
     # is_full
     e.set("xxxxxxxxx")
-    assert e.is_full()
+    assert e.is_full() is True
     e.reset()
 
 
@@ -148,12 +153,28 @@ def test():
     assert e.play("o", "b1")
     assert str(e) == "xo"+7*"."
     assert not e.play("b", "b1")
+    assert not e.play("x", "b1")
+    assert not e.play("x", "d1")
+    assert e.play("x", "c3")
     e.reset()
 
     # is_won
     assert e.play("x", "a1")
     assert e.play("x", "b1")
     assert e.play("x", "c1")
-    assert e.is_won("x")
+    assert e.is_won("x") is True
+    assert e.is_won("o") is False
+    assert e.is_finished()
+    assert not e.play("o", "a2") # Game is over
+    e.reset()
+    assert not e.is_finished()
+
+    # is_finished
+    e.set("xoxxoxoxo")
+    assert e.is_finished()
+    e.set("xo.......")
+    assert not e.is_finished()
+    assert e.play_best("x")
+    assert not e.is_finished()
     e.reset()
 